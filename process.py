@@ -1,10 +1,93 @@
+import io
 import os
 import re
 import sys
 import getopt
+from concurrent.futures import ProcessPoolExecutor
 import xml.etree.ElementTree as ET
 from typing import List, Dict, Tuple, Union, Optional
-from species_link import insert_species_links
+from species_link import SpeciesLinker
+
+
+# Words that bval treats as True
+_TRUTHY = frozenset(('y', 'yes', 'true'))
+
+# Placeholder text used for missing titles and authors (N/A, NA, N.A., ...)
+_NA_RE = re.compile(r'^(N ?A ?|N ?/A ?|N ?\.A\.? ?)', re.I)
+
+# Page ranges that start and end on the same page (e.g. 5-5)
+_REDUNDANT_PAGES = re.compile(r'(\d+)-\1$')
+
+# Abstract section headers. These are fused into a single alternation so
+# an abstract is scanned once, and a header is never wrapped twice
+_INTRO_HEADERS = (
+    r'background(?::|\n)?', r'context(?::|\n)?', r'introduction(?::|\n)?', r'purpose(?::|\n)?',
+    r'case presentation(?::|\n)'
+)
+
+_COMMON_HEADERS = (
+    r'(?:materials|data) and methods?(?::\n)?', r'data source &amp; methods?(?::|\n)?',
+    r'results?(?::|\n)?', r'conclusions?(?::|\n)?', r'objectives?(?::|\n)?',
+    r'discussions?(?::|\n)?', r'antecedente(?::|\n)', r'objetivos?(?::|\n)?',
+    r'm&#233;todos(?::|\n)?', r'resultados(?::|\n)', r'objectif(?::|\n)?',
+    r'm&#233;thodologie(?::|\n)', r'r&#233;sultats(?::|\n)', r'conclusiones(?::|\n)?',
+    # method headers
+    r'methods?(?::|\n)?', r'methodology(?::|\n)?'
+)
+
+_CASE_HEADERS = (
+    r'Aims?(?::|\n)', r'Findings?(?::|\n)', r'FINDINGS?(?::|\n)', r'MAIN CONCLUSIONS?(?::|\n)'
+)
+
+_HEADERS_RE = re.compile(
+    rf'(?P<intro>{"|".join(_INTRO_HEADERS)})'
+    rf'|(?P<common>{"|".join(_COMMON_HEADERS)})'
+    rf'|(?-i:(?P<case>{"|".join(_CASE_HEADERS)}))',
+    re.I
+)
+
+# Literal substitutions applied by common_text_subs. They are matched in a
+# single pass, longest key first so that 'H2O2' wins over 'H2O'
+_TXT_SUBSTITUTIONS = {
+    'H2O2': 'H<sub>2</sub>O<sub>2</sub>',
+    'H2O': 'H<sub>2</sub>O',
+    'H20': 'H<sub>2</sub>0',
+    'H2SO4': 'H<sub>2</sub>SO<sub>4</sub>',
+    '&lt;!--': '<!--',
+    '--&gt;': '-->',
+    '\\\'': '\''
+}
+
+_TXT_RE = re.compile('|'.join(re.escape(k) for k in sorted(_TXT_SUBSTITUTIONS, key=len, reverse=True)))
+
+# (needle, pattern, replacement) triples applied by common_text_subs. A
+# pattern only runs if its needle, a substring every match must contain, is
+# in the text. Patterns are case-sensitive, except where the replacement
+# keeps the matched case.
+_TXT_REGEXES = [
+    # simple tags
+    ('&', re.compile(r'&lt;(|/)(i|b|sup|sub)&gt;', re.I), r'<\1\2>'),
+    # inverse units
+    ('-1', re.compile(r'(m|g|ha| L|ml)-1'), r'\1<sup>-1</sup>'),
+    # scientific notation
+    ('10', re.compile(r'(\d?\.?\d+ ?\n?(x|&#215;)\n? ?10)(-?\d+)'), r'\1<sup>\3</sup>'),
+    # extra whitespace in hyphenations
+    ('-\n', re.compile(r'-\n ?'), r'-'),
+    # 50-doses
+    ('50', re.compile(r'(LC|LD|IC)50'), r'\1<sub>50</sub>'),
+    # Bi-elemental oxygen compounds
+    ('O', re.compile(r'([A-Z]|\d)O(\d)(\d?(\+|-|))'), r'\1O<sub>\2</sub><sup>\3</sup>'),
+    # metre-based units
+    ('m', re.compile(r'/? ?(cm|km|m)(\d)'), r'/\1<sup>\2</sup>'),
+    # Ammonia-based compounds
+    ('NH', re.compile(r'NH(\d)(\+?)'), r'NH<sub>\1</sub><sup>\2</sup>'),
+]
+
+_EMPTY_TAGS = re.compile(r'<(i|b|sup|sub)><\/\1>')
+
+# Inline formatting tags get escaped by ET.tostring, so they're restored on
+# the serialized bytes before writing
+_ESCAPED_INLINE_TAGS = re.compile(rb'&lt;(/?)(i|b|sup|sub|br/)&gt;')
 
 
 def bval(b: str) -> bool:
@@ -14,7 +97,20 @@ def bval(b: str) -> bool:
     :param b: str to be made into a bool
     :returns: truth value of b
     '''
-    return b.lower() in ['y', 'yes', 'true']
+    return b.lower() in _TRUTHY
+
+# Tokens of a journal's .config file, mapped to the setting each one holds
+# and the function that parses its value
+_CONFIG_TOKENS = {
+    'COPYRIGHT': ('copyright', str),
+    'TEXTSUBS': ('text_subs', bval),
+    'NEWLINESBEFORE': ('before_newline_count', int),
+    'NEWLINESAFTER': ('after_newline_count', int),
+    'BOLD': ('bold_headers', bval),
+    'ITALIC': ('italic_headers', bval),
+    'SPECIESLINKS': ('species_links', bval),
+    'SPLITKEYWORDS': ('split_keywords', bval),
+}
 
 def get_input(message: str, input_type: str) -> Union[str, int, bool]:
     '''
@@ -69,12 +165,17 @@ def extract_journal_info(path: str) -> Tuple[str, str, str, str]:
 	inf_volume = folder[2:folder.index("(")]
 	inf_number = folder[folder.index("(")+1:folder.index(")")]
 
-	# Nest a level deeper and get the year
-	for filename in os.listdir(path):
-		# XML files are ALWAYS of the form JJYY###.xml
-		year = filename[2:4]
-		year = "19" + year if int(year) > 80 else "20" + year
-		return (inf_volume, inf_number, year, inf_journal_code)
+	# Nest a level deeper and get the year from the first XML file
+	with os.scandir(path) as entries:
+		filename = next((entry.name for entry in entries if entry.name.endswith('.xml')), None)
+	if filename is None:
+		print(f'No XML Files Error (4): No .xml files found in \'{path}\'')
+		exit(4)
+
+	# XML files are ALWAYS of the form JJYY###.xml
+	year = filename[2:4]
+	year = "19" + year if int(year) > 80 else "20" + year
+	return (inf_volume, inf_number, year, inf_journal_code)
 
 def save_config(journal_code, config: Dict[str, Union[str, bool, int]]) -> None:
 	'''
@@ -84,53 +185,25 @@ def save_config(journal_code, config: Dict[str, Union[str, bool, int]]) -> None:
     :param config: dict of config tokens to values
 	'''
 	config_f = open(f'./config/{journal_code}.config', 'w')
-	for key in config.keys():
-		config_f.write(key + '=' + str(config[key]) + '\n' * (0 if key == 'SPLITKEYWORDS' else 1))
+	for key, value in config.items():
+		config_f.write(key + '=' + str(value) + '\n' * (0 if key == 'SPLITKEYWORDS' else 1))
 	config_f.close()
 
-def already_processed(elem: ET) -> bool:
-    return not elem.attrib['id'] == journal_code + 'xxx'
+def already_processed(elem: ET, placeholder_id: str) -> bool:
+    return not elem.attrib['id'] == placeholder_id
 
 def fix_redundant_page_numbers(elem: ET) -> None:
-    if re.match(r'(\d+)-\1$', elem.attrib['pages']):
+    if _REDUNDANT_PAGES.match(elem.attrib['pages']):
         elem.attrib['pages'] = elem.attrib['pages'][:elem.attrib['pages'].index('-')]
 
 def surround_headers(elem: ET, front: str, intro_front: str, back: str) -> None:
-    intro_headers = [
-        r'background(:|\n)?', r'context(:|\n)?', r'introduction(:|\n)?', r'purpose(:|\n)?',
-        r'case presentation(:|\n)'
-    ]
-
-    common_headers = [
-        r'(materials|data) and methods?(:\n)?', r'data source &amp; methods?(:|\n)?', 
-        r'results?(:|\n)?', r'conclusions?(:|\n)?', r'objectives?(:|\n)?', 
-        r'discussions?(:|\n)?', r'antecedente(:|\n)', r'objetivos?(:|\n)?', 
-        r'm&#233;todos(:|\n)?', r'resultados(:|\n)', r'objectif(:|\n)?',
-        r'm&#233;thodologie(:|\n)', r'r&#233;sultats(:|\n)', r'conclusiones(:|\n)?',
-    ]
-
-    method_headers = [r'methods?(:|\n)?', r'methodology(:|\n)?']
-
-    case_sensitive_common_headers = [r'Aims?(:|\n)', r'Findings?(:|\n)', r'FINDINGS?(:|\n)', 
-        r'MAIN CONCLUSIONS?(:|\n)'
-    ]
-
-    # Apply formatting to intro headers
-    for header in intro_headers:
-        elem.text = re.sub(header, rf'{intro_front}\g<0>{back}', elem.text, flags=re.I)
-
-    # Apply formatting to common and method headers
-    for header in common_headers + method_headers:
-        elem.text = re.sub(header, rf'{front}\g<0>{back}', elem.text, flags=re.I)
+    # Apply formatting to all headers in a single pass. Intro headers get
+    # their own front markup (typically without leading newlines)
+    elem.text = _HEADERS_RE.sub(
+        lambda m: f'{intro_front if m.lastgroup == "intro" else front}{m.group(0)}{back}',
+        elem.text
+    )
 
-    # Apply formatting to case sensitive headers
-    for header in case_sensitive_common_headers:
-        elem.text = re.sub(header, rf'{front}\g<0>{back}', elem.text)
-
-
-    # It's possible for some multi-word headers to get extra formatting
-    elem.text = re.sub(r'<br/><b>(Materials and \n?<br/><b>Methods(:|\n)?)</b></b>', r'<br/><b>\g<1></b>', elem.text, flags=re.I)
-        
 def common_text_subs(elem: ET) -> None:
 	"""
 	Formats words that predominantly require the processor to manually format 
@@ -139,46 +212,228 @@ def common_text_subs(elem: ET) -> None:
 	:param elem: element whose text is to have unformatted words replaced
 	"""
 	
-	txt_substitutions = {
-		'H2O2': 'H<sub>2</sub>O<sub>2</sub>',
-		'H2O': 'H<sub>2</sub>O',
-		'H20': 'H<sub>2</sub>0',
-		'H2SO4': 'H<sub>2</sub>SO<sub>4</sub>',
-		'&lt;!--': '<!--',
-		'--&gt;': '-->',
-		'\\\'': '\''
-	}
-
-	# Store the regexes as single-item tuples (so they'll work in the loop)
-	reg_substitutions = {
-		# simple tags
-		(r'&lt;(|/)(i|b|sup|sub)&gt;',): (r'<\1\2>',),
-		# inverse units  
-		(r'(m|g|ha| L|ml)-1',): (r'\1<sup>-1</sup>',),
-		# scientific notation
-		(r'(\d?\.?\d+ ?\n?(x|&#215;)\n? ?10)(-?\d+)',): (r'\1<sup>\3</sup>',),
-		# extra whitespace in hyphenations
-		(r'-\n ?',): (r'-',),
-		# 50-doses
-		(r'(LC|LD|IC)50',): (r'\1<sub>50</sub>',),
-		# Bi-elemental oxygen compounds
-		(r'([A-Z]|\d)O(\d)(\d?(\+|-|))',): (r'\1O<sub>\2</sub><sup>\3</sup>',),
-		# metre-based units
-		(r'/? ?(cm|km|m)(\d)',): (r'/\1<sup>\2</sup>',),
-		# Ammonia-based compounds
-		(r'NH(\d)(\+?)',): (r'NH<sub>\1</sub><sup>\2</sup>',),
-	}
-
-	# Replace all above simple text matches
-	for key in txt_substitutions.keys():
-		elem.text = elem.text.replace(key, txt_substitutions[key])
-
-	# Replace all the above regex patterns
-	for key in reg_substitutions.keys():
-		elem.text = re.sub(key[0], reg_substitutions[key][0], elem.text, re.I)
+	# Replace all simple text matches
+	elem.text = _TXT_RE.sub(lambda m: _TXT_SUBSTITUTIONS[m.group(0)], elem.text)
+
+	# Replace all the regex patterns
+	for needle, pattern, repl in _TXT_REGEXES:
+		if needle in elem.text:
+			elem.text = pattern.sub(repl, elem.text)
 
 	# Remove any empty tags (a few may be added during the above loops)
-	elem.text = re.sub(r'<(i|b|sup|sub)><\/\1>', '', elem.text, re.I)
+	if '></' in elem.text:
+		elem.text = _EMPTY_TAGS.sub('', elem.text)
+
+def handle_title(elem: ET.Element, ctx: Dict[str, Union[str, bool, int]]) -> None:
+    '''
+    Clears placeholder titles and formats common words in the title
+
+    :param elem: <title> element
+    :param ctx: run configuration and the id of the file being processed
+    '''
+    # Replace NA titles if applicable
+    if _NA_RE.match(elem.text):
+        elem.text = ''
+
+    # Apply common textual substitutions to title
+    if ctx['text_subs']:
+        common_text_subs(elem)
+
+def handle_copyright(elem: ET.Element, ctx: Dict[str, Union[str, bool, int]]) -> None:
+    '''
+    Fills in copyright information
+
+    :param elem: <copyright> element
+    :param ctx: run configuration and the id of the file being processed
+    '''
+    if ctx['copyright'] is None:
+        elem.text = f'{ctx["copyright_prefix"]}{elem.text}'
+    else:
+        elem.text = ctx['copyright']
+
+def handle_keyword(elem: ET.Element, ctx: Dict[str, Union[str, bool, int]]) -> None:
+    '''
+    Removes superfluous commas from keywords
+
+    :param elem: <keyword> element
+    :param ctx: run configuration and the id of the file being processed
+    '''
+    elem.text = elem.text.replace(',;', ';')
+    if ctx['split_keywords']:
+        elem.text = elem.text.replace(',', ';')
+
+def handle_index(elem: ET.Element, ctx: Dict[str, Union[str, bool, int]]) -> None:
+    '''
+    Updates the id in the index tag
+
+    :param elem: <index> element
+    :param ctx: run configuration and the id of the file being processed
+    '''
+    elem.text = elem.text.replace(ctx['placeholder_id'], ctx['file_id'])
+
+def handle_abstract(elem: ET.Element, ctx: Dict[str, Union[str, bool, int]]) -> None:
+    '''
+    Formats section headers and common words in the abstract
+
+    :param elem: <abstract> element
+    :param ctx: run configuration and the id of the file being processed
+    '''
+    # Add linebreaks, bolding, and italics to common headers
+    if ctx['header_markup'] is not None:
+        surround_headers(elem, *ctx['header_markup'])
+
+    # Apply common textual substitutions to abstract
+    if ctx['text_subs']:
+        common_text_subs(elem)
+
+def header_markup(config: Dict[str, Union[str, bool, int]]) -> Optional[Tuple[str, str, str]]:
+    '''
+    Builds the markup that surrounds abstract section headers for this run
+
+    :param config: journal configuration
+    :returns: (front, intro_front, back) markup for surround_headers, or None if
+              headers are left as they are
+    '''
+    before = '<br/>' * config['before_newline_count']
+    after = '<br/>' * config['after_newline_count']
+
+    if config['bold_headers'] and config['italic_headers']:
+        return (before + '<b><i>', '<b><i>', '</i></b>' + after)
+    elif config['bold_headers']:
+        return (before + '<b>', '<b>', '</b>' + after)
+    elif config['italic_headers']:
+        return (before + '<i>', '<i>', '</i>' + after)
+    elif before or after:
+        return (before, '', after)
+    return None
+
+def handle_author(elem: ET.Element, ctx: Dict[str, Union[str, bool, int]]) -> None:
+    '''
+    Removes an NA author
+
+    :param elem: <author> element
+    :param ctx: run configuration and the id of the file being processed
+    '''
+    if _NA_RE.match(elem.text):
+        elem.text = ''
+
+def handle_authors(elem: ET.Element, ctx: Dict[str, Union[str, bool, int]]) -> None:
+    '''
+    Removes NA authors
+
+    :param elem: <authors> element
+    :param ctx: run configuration and the id of the file being processed
+    '''
+    for sub_elem in elem.iter('lastname'):
+        if _NA_RE.match(sub_elem.text):
+            sub_elem.text = ''
+
+# Maps tags to the function that processes them
+_TAG_HANDLERS = {
+    'title': handle_title,
+    'copyright': handle_copyright,
+    'keyword': handle_keyword,
+    'index': handle_index,
+    'abstract': handle_abstract,
+    'author': handle_author,
+    'authors': handle_authors,
+}
+
+class InlineTagWriter:
+    '''
+    Binary file wrapper that ElementTree can stream serialized XML into.
+    Escaped inline tags are restored in each chunk as it is written, and
+    non-ASCII characters are written as character references.
+
+    ElementTree escapes and writes each text, tail, and attribute value in a
+    single call, so an escaped tag never straddles two chunks.
+    '''
+
+    def __init__(self, f) -> None:
+        self.f = f
+
+    def write(self, chunk: str) -> None:
+        self.f.write(_ESCAPED_INLINE_TAGS.sub(rb'<\1\2>', chunk.encode('ascii', 'xmlcharrefreplace')))
+
+def write_article(root: ET.Element, f) -> None:
+    '''
+    Serializes root into the binary file f without building the whole
+    document in memory first
+
+    :param root: root element of the article to write
+    :param f: file (or file-like object) opened for binary writing
+    '''
+    ET.ElementTree(root).write(InlineTagWriter(f), encoding='unicode')
+
+# Species linker of this worker process (see init_worker)
+_species_linker = None
+
+def init_worker(species_links: bool) -> None:
+    '''
+    Prepares a worker process. The species linker is built once per worker,
+    rather than once per file
+
+    :param species_links: whether species links will be inserted this run
+    '''
+    global _species_linker
+    if species_links:
+        _species_linker = SpeciesLinker()
+
+def process_file(path: str, ctx: Dict[str, Union[str, bool, int]]) -> Tuple[bool, Optional[Tuple[str, str, str]], Optional[str]]:
+    '''
+    Processes a single XML file and saves it in place. Files are independent
+    of one another, so this is safe to run in a worker process
+
+    :param path: path to the XML file
+    :param ctx: run configuration shared by the tag handlers
+    :returns: False if the file was already processed (True otherwise), the
+              article's (volume, number, year) if the root is an <article>, and
+              the processed XML if in debug mode (in which case nothing is saved)
+    '''
+    # Parse XML into a tree and loop through all tags. The raw bytes are
+    # handed to the parser, which takes care of decoding them
+    f = open(path, 'rb')
+    root = ET.fromstring(f.read())
+    f.close()
+
+    file_id = os.path.basename(path)[:-4]
+    metadata = None
+
+    if root.tag == 'article':
+        # Check if this file has already been processed (skip if so)
+        if already_processed(root, ctx['placeholder_id']):
+            return (False, None, None)
+
+        # Set ID
+        root.attrib['id'] = file_id
+
+        # Fix redundant page numbers, if possible
+        fix_redundant_page_numbers(root)
+
+        # Keep <article> attributes for the discrepancy analysis
+        metadata = (root.attrib['volume'], root.attrib['number'], root.attrib['year'])
+
+    # Dispatch each tag to its handler (most tags have none)
+    ctx = {**ctx, 'file_id': file_id}
+    for elem in root.iter():
+        handler = _TAG_HANDLERS.get(elem.tag)
+        if handler is not None:
+            handler(elem, ctx)
+
+    # Insert species links if appropriate
+    if ctx['species_links']:
+        _species_linker.insert(root)
+
+    # If we're in debug mode, hand the XML back to be printed. Otherwise save to file
+    if ctx['debug']:
+        buf = io.BytesIO()
+        write_article(root, buf)
+        return (True, metadata, buf.getvalue().decode('utf-8'))
+
+    f = open(path, 'wb')
+    write_article(root, f)
+    f.close()
+    return (True, metadata, None)
 
 def write_problems_file(path: str, files: Dict[str, str]) -> None:
     """
@@ -189,44 +444,31 @@ def write_problems_file(path: str, files: Dict[str, str]) -> None:
     :returns: None
     """
     file_body = "Proofed by: \n\n"
-    for file in files.keys():
+    for file in files:
         file_body += file[:len(file)-4] + ":\n\n"
 
     f = open(path, "w")
     f.write(file_body)
     f.close()
 
-def exists_discrepancies(d: Dict[str, str], expected: str) -> bool:
+def collect_discrepancies(d: Dict[str, str], expected: str) -> Dict[str, str]:
     '''
-    Returns True if any keys of d map to a value other than expected, false otherwise
-    
+    Returns the entries of d that map to a value other than expected
+
     :param d: dictionary to check
     :param expected: expected value for all keys of d
-    :returns: True if at least one value in d != expected, false otherwise
+    :returns: dictionary of problematic keys (empty if there are none)
     '''
-    for key in d.keys():
-        if d[key] != expected:
-            return True
-    return False
+    return {key: value for key, value in d.items() if value != expected}
 
-def print_discrepancy_report(d: Dict[str, str], disc_type: str) -> Dict[str, str]:
+def print_discrepancy_report(problems: Dict[str, str], disc_type: str, expected: str) -> None:
     '''
     Displays message to user listing all errors found of type disc_type and correction.
-    Returns dictionary of problematic files
     '''
 
     print(f'Journal {disc_type} discrepancies:')
-    # Todo: add error handling
-    expected = {'volume':volume,'number':number,'year':year}[disc_type]
-
-    problems = dict()
-    for key in d.keys():
-        if d[key] != expected:
-            problems[key] = d[key]
-    for key in problems.keys():
-        print(f'  {key}: Expected {disc_type}="{expected}" but got {disc_type}="{problems[key]}" instead')
-
-    return problems
+    for key, value in problems.items():
+        print(f'  {key}: Expected {disc_type}="{expected}" but got {disc_type}="{value}" instead')
 
 
 def fix_discrepancies(files: Dict[str, str], directory_path: str, disc_type: str, expected: str) -> None:
@@ -235,18 +477,20 @@ def fix_discrepancies(files: Dict[str, str], directory_path: str, disc_type: str
     '''
 
     # Loop through each file that needs fixing
-    for filename in files.keys():
+    for filename in files:
         print(f'Fixing {filename}...')
+        path = directory_path + filename
 
         # Read in file contents
-        tree = ET.parse(filepath + filename)
-        article = tree.getroot()
+        f = open(path, 'rb')
+        article = ET.fromstring(f.read())
+        f.close()
 
         # Replace incorrect attribute with expected one in article tag
         article.set(disc_type, expected)
 
         # Index tag also needs to be updated
-        index = root.find('index')
+        index = article.find('index')
         index_tokens = index.text.split(' ')
         vn = index_tokens[2].split('N')
         if disc_type == 'volume':
@@ -258,12 +502,11 @@ def fix_discrepancies(files: Dict[str, str], directory_path: str, disc_type: str
         index.text = ' '.join(index_tokens)
 
         # If we're in debug mode, print lines to console. Otherwise save to file
-        text = re.sub(r'&lt;(/)?(i|b|sup|sub|br/)&gt;', r'<\g<1>\g<2>>', ET.tostring(root).decode('utf-8'))
         if DEBUG:
             pass
         else:
-            f = open(filepath + filename, 'w', encoding='utf-8')
-            f.write(text)
+            f = open(path, 'wb')
+            write_article(article, f)
             f.close()
 
 
@@ -272,232 +515,162 @@ def fix_discrepancies(files: Dict[str, str], directory_path: str, disc_type: str
 # MAIN #
 ########
 
-# Handle command line arguments
-DEBUG = False
-PATH = None
-
-try:
-    opts, args = getopt.getopt(sys.argv[1:], 'p:d', ['path=', 'debug'])
-except getopt.GetoptError as e:
-    print(e)
-    exit(3)
-
-for opt, arg in opts:
-    if opt in ('-p', '--path'):
-        PATH = arg.replace('\\', '/')
-    elif opt in ('-d', '--debug'):
-        DEBUG = True
-
-# Get filepath of XML folder to process, and format appropriately
-filepath = PATH
-if (filepath == None):
-    filepath = get_input('Enter path to xml folder to process: ', 's').replace('\\', '/')
-if not filepath.endswith('/'):
-    filepath += '/'
-
-# Ensure path meets the pattern: .../jjv(n)/xml/
-if not re.match(r'.*\/[a-z]{2}\d+\(.+\)\/xml\/$', filepath):
-    print('Filepath Format Error (2): Filepath should end with /jjvv(n)/xml/')
-    exit(2)
-
-# Determine volume, year, issue, and number based on the path to the xml folder
-(volume, number, year, journal_code) = extract_journal_info(filepath)
-
-
-# Prep configurational variables
-copyright = 'default'
-text_subs = False
-before_newline_count = 0
-after_newline_count = 0
-bold_headers = False
-italic_headers = False
-species_links = False
-split_keywords = True
-
-try:
-    # Read in config data from appropriate config file if it exists, else prompt it from user
-    config_f = open(f'./config/{journal_code}.config', 'r')
-    print(f'Loading configuration for \'{journal_code}\'...')
-    for line in config_f.readlines():
-        tokens = [t.strip() for t in line.split('=')]
-        if tokens[0] == 'COPYRIGHT':
-            copyright = tokens[1]
-        elif tokens[0] == 'TEXTSUBS':
-            text_subs = bval(tokens[1])
-        elif tokens[0] == 'NEWLINESBEFORE':
-            before_newline_count = int(tokens[1])
-        elif tokens[0] == 'NEWLINESAFTER':
-            after_newline_count = int(tokens[1])
-        elif tokens[0] == 'BOLD':
-            bold_headers = bval(tokens[1])
-        elif tokens[0] == 'ITALIC':
-            italic_headers = bval(tokens[1])
-        elif tokens[0] == 'SPECIESLINKS':
-            species_links = bval(tokens[1])
-        elif tokens[0] == 'SPLITKEYWORDS':
-            split_keywords = bval(tokens[1])
-        elif len(tokens[0]) > 0: #UNKNOWN TOKEN
-            print(f'Unknown Token Error (1): Unknown token \'{tokens[0]}\' in file \'{journal_code}.config\'')
-            exit(1)
-
-except FileNotFoundError:
-    # Manually retrieve config values from user
-    copyright = get_input('Enter the journal copyright (or \"default\" if unsure): ', 's')
-    text_subs = get_input('Auto-format common words? (y/n): ', 'b')
-    add_newline = get_input('Add newlines before abstract section headers? (y/n): ', 'b')
-    if (add_newline):
-        before_newline_count = get_input('How many? ', 'i')
-    add_newline = get_input('Add newlines after abstract section headers? (y/n): ', 'b')
-    if (add_newline):
-        after_newline_count = get_input('How many? ', 'i')
-    bold_headers = get_input('Bold abstract headers? (y/n): ', 'b')
-    italic_headers = get_input('Italic abstract headers? (y/n): ', 'b')
-    species_links = get_input('Attempt to automatically insert species links? (y/n): ', 'b')
-    split_keywords = get_input('Keywords uploaded as comma-delimited strings? (y/n): ', 'b')
-
-    # Save configuration to file later reuse if desired
-    save = get_input(f'Save this configuration for \'{journal_code}\'? (y/n): ', 'b')
-    if save:
-        save_config(journal_code, {
-            'COPYRIGHT': copyright,
-            'TEXTSUBS': text_subs,
-            'NEWLINESBEFORE': before_newline_count,
-            'NEWLINESAFTER': after_newline_count,
-            'BOLD': bold_headers,
-            'ITALIC': italic_headers,
-            'SPECIESLINKS': species_links,
-            'SPLITKEYWORDS': split_keywords
-        })
-        print('Configuration saved!\n')
-
-
-
-
-# Define dictionaries to search later for metadata discrepancies
-file_to_volume = dict()
-file_to_number = dict()
-file_to_year = dict()
-
-# Loop through each XML file in the directory
-print('Starting XML processing')
-for filename in os.listdir(filepath):
-    if filename.endswith('.xml'):
-        # Parse XML into a tree and loop through all tags
-        f = open(filepath + filename, 'r')
-        root = ET.fromstring(f.read())
-        f.close()
+# Worker processes import this module, so only run when executed directly
+if __name__ == '__main__':
+    # Handle command line arguments
+    DEBUG = False
+    PATH = None
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'p:d', ['path=', 'debug'])
+    except getopt.GetoptError as e:
+        print(e)
+        exit(3)
+
+    for opt, arg in opts:
+        if opt in ('-p', '--path'):
+            PATH = arg.replace('\\', '/')
+        elif opt in ('-d', '--debug'):
+            DEBUG = True
+
+    # Get filepath of XML folder to process, and format appropriately
+    filepath = PATH
+    if (filepath == None):
+        filepath = get_input('Enter path to xml folder to process: ', 's').replace('\\', '/')
+    if not filepath.endswith('/'):
+        filepath += '/'
+
+    # Ensure path meets the pattern: .../jjv(n)/xml/
+    if not re.match(r'.*\/[a-z]{2}\d+\(.+\)\/xml\/$', filepath):
+        print('Filepath Format Error (2): Filepath should end with /jjvv(n)/xml/')
+        exit(2)
+
+    # Determine volume, year, issue, and number based on the path to the xml folder
+    (volume, number, year, journal_code) = extract_journal_info(filepath)
+
+
+    # Prep configurational variables
+    config = {
+        'copyright': 'default',
+        'text_subs': False,
+        'before_newline_count': 0,
+        'after_newline_count': 0,
+        'bold_headers': False,
+        'italic_headers': False,
+        'species_links': False,
+        'split_keywords': True,
+    }
+
+    try:
+        # Read in config data from appropriate config file if it exists, else prompt it from user
+        with open(f'./config/{journal_code}.config', 'r') as config_f:
+            print(f'Loading configuration for \'{journal_code}\'...')
+            for line in config_f:
+                tokens = [t.strip() for t in line.split('=')]
+                if tokens[0] in _CONFIG_TOKENS:
+                    (setting, parse) = _CONFIG_TOKENS[tokens[0]]
+                    config[setting] = parse(tokens[1])
+                elif len(tokens[0]) > 0: #UNKNOWN TOKEN
+                    print(f'Unknown Token Error (1): Unknown token \'{tokens[0]}\' in file \'{journal_code}.config\'')
+                    exit(1)
+
+    except FileNotFoundError:
+        # Manually retrieve config values from user
+        config['copyright'] = get_input('Enter the journal copyright (or \"default\" if unsure): ', 's')
+        config['text_subs'] = get_input('Auto-format common words? (y/n): ', 'b')
+        add_newline = get_input('Add newlines before abstract section headers? (y/n): ', 'b')
+        if (add_newline):
+            config['before_newline_count'] = get_input('How many? ', 'i')
+        add_newline = get_input('Add newlines after abstract section headers? (y/n): ', 'b')
+        if (add_newline):
+            config['after_newline_count'] = get_input('How many? ', 'i')
+        config['bold_headers'] = get_input('Bold abstract headers? (y/n): ', 'b')
+        config['italic_headers'] = get_input('Italic abstract headers? (y/n): ', 'b')
+        config['species_links'] = get_input('Attempt to automatically insert species links? (y/n): ', 'b')
+        config['split_keywords'] = get_input('Keywords uploaded as comma-delimited strings? (y/n): ', 'b')
+
+        # Save configuration to file later reuse if desired
+        save = get_input(f'Save this configuration for \'{journal_code}\'? (y/n): ', 'b')
+        if save:
+            save_config(journal_code, {token: config[setting] for token, (setting, _) in _CONFIG_TOKENS.items()})
+            print('Configuration saved!\n')
+
+
+
+
+    # Settings shared by the tag handlers. Strings that only depend on the run
+    # are built once here rather than per element
+    copyright_prefix = f'Copyright {year} - '
+    ctx = {
+        'placeholder_id': f'{journal_code}xxx',
+        'copyright_prefix': copyright_prefix,
+        'copyright': None if config['copyright'].lower() == 'default' else copyright_prefix + config['copyright'],
+        'text_subs': config['text_subs'],
+        'header_markup': header_markup(config),
+        'split_keywords': config['split_keywords'],
+        'species_links': config['species_links'],
+        'debug': DEBUG,
+    }
+
+    # Define dictionaries to search later for metadata discrepancies
+    file_to_volume = dict()
+    file_to_number = dict()
+    file_to_year = dict()
+
+    # Process the XML files in parallel, then report on them in directory order.
+    # A file that fails is reported and left out, so the rest still get the
+    # problems file and discrepancy analysis
+    print('Starting XML processing')
+    with os.scandir(filepath) as entries:
+        filenames = [entry.name for entry in entries if entry.name.endswith('.xml')]
+    with ProcessPoolExecutor(initializer=init_worker, initargs=(config['species_links'],)) as executor:
+        futures = [executor.submit(process_file, filepath + filename, ctx) for filename in filenames]
+        for filename, future in zip(filenames, futures):
+            try:
+                (processed, metadata, output) = future.result()
+            except Exception as e:
+                print(f'Processing Error: Could not process \'{filename}\' ({type(e).__name__}: {e})')
+                continue
 
-        if root.tag == 'article':
-            # Check if this file has already been processed (skip if so)
-            if already_processed(root):
+            if not processed:
                 print('Already processed ' + filename + '...')
                 continue
-            else:
-                print('Processing ' + filename)
-
-            # Set ID
-            root.attrib['id'] = filename[0:-4]
-
-            # Fix redundant page numbers, if possible
-            fix_redundant_page_numbers(root)
-
-            # Add <article> attributes to discrepancy dictionaries
-            file_to_volume[filename] = root.attrib['volume']
-            file_to_number[filename] = root.attrib['number']
-            file_to_year[filename] = root.attrib['year']
-
-
-        for elem in root.iter():
-            
-            if elem.tag == 'title':
-                # Replace NA titles if applicable
-                if re.match(r'^(N ?A ?|N ?/A ?|N ?\.A\.? ?)', elem.text, re.I):
-                    elem.text = ''
-
-                # Apply common textual substitutions to title
-                if text_subs:
-                    common_text_subs(elem)
-
-            elif elem.tag == 'copyright':
-                # Fill in copyright information
-                if copyright.lower() == 'default':
-                    elem.text = f'Copyright {year} - {elem.text}'
-                else:
-                    elem.text = f'Copyright {year} - {copyright}'
-
-            elif elem.tag == 'keyword':
-                # Remove superfluous commas from keywords
-                elem.text = elem.text.replace(',;', ';')
-                if split_keywords:
-                    elem.text = elem.text.replace(',', ';')
-
-            elif elem.tag == 'index':
-                # Update id in the index tag
-                elem.text = elem.text.replace(f'{journal_code}xxx', filename[:-4])
-
-            elif elem.tag == 'abstract':
-                # Add linebreaks, bolding, and italics to common headers
-                if bold_headers and italic_headers:
-                    surround_headers(elem, '<br/>' * before_newline_count + '<b><i>', '<b><i>', '</i></b>' + '<br/>' * after_newline_count)
-                elif bold_headers:
-                    surround_headers(elem, '<br/>' * before_newline_count + '<b>', '<b>', '</b>' + '<br/>' * after_newline_count)
-                elif italic_headers:
-                    surround_headers(elem, '<br/>' * before_newline_count + '<i>', '<i>', '</i>' + '<br/>' * after_newline_count)
-                elif before_newline_count > 0 or after_newline_count > 0:
-                    surround_headers(elem, '<br/>' * before_newline_count, '', '<br/>' * after_newline_count)
-
-                # Apply common textual substitutions to abstract
-                if text_subs:
-                    common_text_subs(elem)
-
-            elif elem.tag == 'author':
-                # Remove NA author
-                if re.match(r'^(N ?A ?|N ?/A ?|N ?\.A\.? ?)', elem.text, re.I):
-                    elem.text = ''
-
-            elif elem.tag == 'authors':
-                # Remove NA authors
-                for sub_elem in elem.iter():
-                    if sub_elem.tag == 'lastname' and re.match(r'^(N ?A ?|N ?/A ?|N ?\.A\.? ?)', sub_elem.text, re.I):
-                        sub_elem.text = ''
-
-
-        # Insert species links if appropriate
-        if species_links:
-            insert_species_links(root)
 
-        # If we're in debug mode, print lines to console. Otherwise save to file
-        text = re.sub(r'&lt;(/)?(i|b|sup|sub|br/)&gt;', r'<\g<1>\g<2>>', ET.tostring(root).decode('utf-8'))
-        if DEBUG:
-            print(f'----------\n{text}\n----------')
-        else:
-            f = open(filepath + filename, 'w', encoding='utf-8')
-            f.write(text)
-            f.close()
+            if metadata is not None:
+                print('Processed ' + filename)
+
+                # Add <article> attributes to discrepancy dictionaries
+                (file_to_volume[filename], file_to_number[filename], file_to_year[filename]) = metadata
+
+            if output is not None:
+                print(f'----------\n{output}\n----------')
 
-print('Completed XML processing!\n')
-print('Generating problems.txt...')
-write_problems_file(f'{filepath}../{journal_code}{volume}({number}) Problems.txt', file_to_volume)
-print('Proofing file generated!\n')
-print('Running discrepancy analysis...')
+    print('Completed XML processing!\n')
+    print('Generating problems.txt...')
+    write_problems_file(f'{filepath}../{journal_code}{volume}({number}) Problems.txt', file_to_volume)
+    print('Proofing file generated!\n')
+    print('Running discrepancy analysis...')
 
-# Fix any possible outliers in volume, number, and year if desired
-confirmation = f"Would you like to automatically fix these problems? (y/n): s"
+    # Fix any possible outliers in volume, number, and year if desired
+    confirmation = f"Would you like to automatically fix these problems? (y/n): s"
 
-if exists_discrepancies(file_to_volume, volume):
-    problems = print_discrepancy_report(file_to_volume, 'volume')
-    if get_input(confirmation, 'b'):
-        fix_discrepancies(problems, filepath, 'volume', volume)
+    problems = collect_discrepancies(file_to_volume, volume)
+    if problems:
+        print_discrepancy_report(problems, 'volume', volume)
+        if get_input(confirmation, 'b'):
+            fix_discrepancies(problems, filepath, 'volume', volume)
 
-if exists_discrepancies(file_to_number, number):
-    problems = print_discrepancy_report(file_to_number, 'number')
-    if get_input(confirmation, 'b'):
-        fix_discrepancies(problems, filepath, 'number', number)
+    problems = collect_discrepancies(file_to_number, number)
+    if problems:
+        print_discrepancy_report(problems, 'number', number)
+        if get_input(confirmation, 'b'):
+            fix_discrepancies(problems, filepath, 'number', number)
 
-if exists_discrepancies(file_to_year, year):
-    problems = print_discrepancy_report(file_to_year, 'year')
-    if get_input(confirmation, 'b'):
-        fix_discrepancies(problems, filepath, 'year', year)
+    problems = collect_discrepancies(file_to_year, year)
+    if problems:
+        print_discrepancy_report(problems, 'year', year)
+        if get_input(confirmation, 'b'):
+            fix_discrepancies(problems, filepath, 'year', year)
 
 
-print("Done!")
+    print("Done!")
@@ -1,4 +1,6 @@
 import re
+from collections import defaultdict, namedtuple
+from functools import lru_cache
 
 # Allows species links to be added to highlighted text
 # SUBLIME TEXT PLUGIN
@@ -23,99 +25,46 @@ except ImportError:
 except NameError:
     pass
 
+# Patterns used to recognize (and take apart) existing species links
+_SPECIES_LINK = re.compile(r'^<taxon genus=".*" species=".*" sub-prefix=".*" sub-species=".*">.*<\/taxon>$')
+_TAXON_OPEN_TAG = re.compile(r'<taxon genus=".*" species=".*" sub-prefix=".*" sub-species=".*">')
+_SP_TAG = re.compile(r'<\/?sp>')
+
+# One parsed line of common_species.txt. forms is a pattern (compiled as part of
+# SpeciesLinker.scan's alternation) matching both its full and short forms, with
+# group 1 set only for the full form. needle is the lowercased species name,
+# which every match contains
+SpeciesRec = namedtuple('SpeciesRec', 'pseudo needle forms')
+
+# Runs of spaces and newlines (see remove_blank_chars)
+_BLANKS = re.compile(r'[ \n]+')
+
 # MAIN SPECIES LINK CODE #
-def insert_species_links(root):
+class SpeciesLinker:
     '''
-    (Element) -> None
-    Inserts species links into article (titles + abstracts) where possible
+    Inserts species links into articles. The common species list is read
+    once, when the linker is created, and reused for every article
     '''
-    
-    # Read in common species
-    f = open('./common_species.txt')
-    species_list = f.read().splitlines()
-    f.close()
-
-    inserted_links = []
-    short_forms = []
-    genus_to_species = []
-
-    #################
-    # PART 1: TITLE #
-    #################
-    for title in root.iter('title'):
-        inserted_links.append(dict())
-        short_forms.append(dict())
-        genus_to_species.append(dict())
-
-        
-
-        # Check the title for each individual species in common_species.txt
-        for species in species_list:
-            # Only consider non-asterisk-marked species from list
-            if not re.search(r'.* .*', species):
-                continue
 
-            # A pseudospecies is a species that does not show up in the CRIA database
-            # Denoted by a prefixed asterisk (which we remove here)
-            pseudospecies = False
-            if species[0] == '*':
-                species = species[1:]
-                pseudospecies = True
-            
-            matches = []
-            short_matches = []
-            short_form = ''
-            parts = species.split(' ')
+    def __init__(self, species_path='./common_species.txt'):
+        '''
+        (str) -> None
 
-            # Fill in the genus_to_species dict
-            if pseudospecies:
-                if '*' + parts[0] not in genus_to_species[-1]:
-                    genus_to_species[-1]['*' + parts[0]] = []
-                if parts[1] not in genus_to_species[-1]['*' + parts[0]]:
-                    genus_to_species[-1]['*' + parts[0]].append(parts[1])
-            else:
-                if parts[0] not in genus_to_species[-1]:
-                    genus_to_species[-1][parts[0]] = []
-                if parts[1] not in genus_to_species[-1][parts[0]]:
-                    genus_to_species[-1][parts[0]].append(parts[1])
-
-            # Get indices of all occurrences of full species name
-            short_form = f'{parts[0][0]}. {" ".join(parts[1:])}'
-            for match in re.finditer(re.escape(parts[0]) + r' *\n? *' + re.escape(parts[1]), title.text, re.IGNORECASE):
-                matches.append(match.span())
-
-            # Replace all full occurrences with a standard '{genus} {species}' format
-            # Italicize all but the first occurrence (if not a pseudospecies)
-            for i in range(len(matches) -1, -1, -1):
-                spec = remove_blank_chars(title.text[matches[i][0]: matches[i][1]])
-                if (i == 0 and not pseudospecies):
-                    title.text = title.text[:matches[i][0]] + get_species_link(spec) + title.text[matches[i][1]:]
-                else:
-                    title.text = title.text[:matches[i][0]] + f'<i>{spec}</i>' + title.text[matches[i][1]:]
-
-            # Get indices of all occurrences of short form of species name
-            short_parts = short_form.split(' ')
-            if len(short_parts) > 1:
-                for match in re.finditer(re.escape(short_parts[0]) + r' *\n? *' + re.escape(' '.join(parts[1:])), title.text, re.IGNORECASE):
-                    short_matches.append(match.span())
-
-            # Replace all short form occurrences with standard 'C. {species}' format.
-            # Italicize all occurrences
-            for i in range(len(short_matches) -1, -1, -1):
-                spec = remove_blank_chars(title.text[short_matches[i][0]: short_matches[i][1]])
-                title.text = title.text[:short_matches[i][0]] + f'<i>{spec}</i>' + title.text[short_matches[i][1]:]
-
-
-    ####################
-    # PART 2: ABSTRACT #
-    ####################
-    j = 0
-    for abstract in root.iter('abstract'):
-
-        # Check the abstract for each individual species in common_species.txt
+        :param species_path: path to the list of common species
+        '''
+        f = open(species_path)
+        species_list = f.read().splitlines()
+        f.close()
+
+        # Build the patterns for each species (and genus) once, rather than
+        # for every title and abstract they're checked against
+        self.species = []
+        self.genus_to_species = defaultdict(set)
         for species in species_list:
-            # Only consider non-asterisk-marked species from list
-            if not re.search(r'.* .*', species):
+            # Only consider entries with both a genus and a species name. Stray
+            # whitespace around an entry would end up in its patterns
+            species = species.strip()
+            if ' ' not in species:
                 continue
 
             # A pseudospecies is a species that does not show up in the CRIA database
@@ -124,90 +73,164 @@ def insert_species_links(root):
             if species[0] == '*':
                 species = species[1:]
                 pseudospecies = True
-            
-            matches = []
-            short_matches = []
-            short_form = ''
-            parts = species.split(' ')
 
-            # Fill in the genus_to_species dict
-            if pseudospecies:
-                if '*' + parts[0] not in genus_to_species[j]:
-                    genus_to_species[j]['*' + parts[0]] = []
-                if parts[1] not in genus_to_species[j]['*' + parts[0]]:
-                    genus_to_species[j]['*' + parts[0]].append(parts[1])
+            # The full form is '{genus} {species}', the short form 'G. {species ...}'.
+            # They share the species name unless there's more to it than one word.
+            # Both end on a word boundary and the short form starts on one, so
+            # neither can match inside a longer word (e.g. 's. Amara' in 'Ananas.
+            # Amaranthus')
+            parts = species.split(' ')
+            (genus, short) = (re.escape(parts[0]), r'\b' + re.escape(parts[0][0] + '.'))
+            if len(parts) == 2:
+                forms = f'(?:({genus})|{short}) *\n? *{re.escape(parts[1])}\\b'
             else:
-                if parts[0] not in genus_to_species[j]:
-                    genus_to_species[j][parts[0]] = []
-                if parts[1] not in genus_to_species[j][parts[0]]:
-                    genus_to_species[j][parts[0]].append(parts[1])
-
-            # Get indices of all occurrences of full species name
-            short_form = f'{parts[0][0]}. {" ".join(parts[1:])}'
-            for match in re.finditer(re.escape(parts[0]) + r' *\n? *' + re.escape(parts[1]), abstract.text, re.IGNORECASE):
-                matches.append(match.span())
-
-            # Replace all full occurrences with a standard '{genus} {species}' format
-            # Italicize all but the first occurrence (if not a pseudospecies)
-            for i in range(len(matches) -1, -1, -1):
-                spec = remove_blank_chars(abstract.text[matches[i][0]: matches[i][1]])
-                if (i == 0 and not pseudospecies and spec not in genus_to_species[j]):
-                    abstract.text = abstract.text[:matches[i][0]] + get_species_link(spec) + abstract.text[matches[i][1]:]
-                else:
-                    abstract.text = abstract.text[:matches[i][0]] + f'<i>{spec}</i>' + abstract.text[matches[i][1]:]
-
-            # Get indices of all occurrences of short form of species name
-            short_parts = short_form.split(' ')
-            if len(short_parts) > 1:
-                for match in re.finditer(re.escape(short_parts[0]) + r' *\n? *' + re.escape(' '.join(parts[1:])), abstract.text, re.IGNORECASE):
-                    short_matches.append(match.span())
-
-            # Replace all short form occurrences with standard 'C. {species}' format.
-            # Italicize all occurrences
-            for i in range(len(short_matches) -1, -1, -1):
-                spec = remove_blank_chars(abstract.text[short_matches[i][0]: short_matches[i][1]])
-                abstract.text = abstract.text[:short_matches[i][0]] + f'<i>{spec}</i>' + abstract.text[short_matches[i][1]:]
-
-        #####################
-        # PART 2.2: GENUSES #
-        #####################
-
-        # For each linked species in each language abstract, if it's genus occurs on its own before any
-        # links of the same genus (but different species), add a species link
-
-        # Find all links for a given genus
-        for genus in genus_to_species[j].keys():
-            # The following regex matches species links for any species of a given genus currently processed
-            master_reg = r'<taxon genus="' + re.escape(genus) + r'" species="('
-            for i in range(len(genus_to_species[j][genus])):
-                if i < len(genus_to_species[j][genus]) - 1:
-                    master_reg += re.escape(f'{genus_to_species[j][genus][i]}') + '|'
-                else:
-                    master_reg += re.escape(f'{genus_to_species[j][genus][i]}') + ')"'
-
-            # Find all links that match said expression
-            matches = []
-            for match in re.finditer(master_reg, abstract.text, re.IGNORECASE):
-                matches.append(match.span())
-
-            if len(matches) > 0:
+                forms = f'(?:({genus}) *\n? *{re.escape(parts[1])}|{short} *\n? *{re.escape(" ".join(parts[1:]))})\\b'
+
+            self.species.append(SpeciesRec(
+                pseudospecies,
+                parts[1].lower(),
+                forms
+            ))
+
+            # Every species of each genus. Pseudospecies genuses are prefixed with an asterisk
+            genus = '*' + parts[0] if pseudospecies else parts[0]
+            self.genus_to_species[genus].add(parts[1])
+
+        # Matches species links for any species of each genus, and the genus name anywhere
+        self.link_patterns = dict()
+        self.genus_names = dict()
+        for genus, species in self.genus_to_species.items():
+            self.link_patterns[genus] = re.compile(r'<taxon genus="' + re.escape(genus) + r'" species="(' + '|'.join(map(re.escape, species)) + ')"', re.IGNORECASE)
+            self.genus_names[genus] = re.compile(re.escape(genus), re.IGNORECASE)
+
+        # Any genus on its own, preceded by a space and followed by a space, newline
+        # or punctuation. The delimiters are lookarounds so back-to-back genuses
+        # are all matched
+        genuses = dict.fromkeys(genus.lstrip('*') for genus in self.genus_to_species)
+        self.genus_scanner = re.compile(r'(?<= )(' + '|'.join(map(re.escape, genuses)) + r')(?=[ \n.,?!])', re.IGNORECASE)
+
+    def scan(self, text, exclude=()):
+        '''
+        (str, container) -> str
+        Replaces all full occurrences of each species in text with a standard
+        '{genus} {species}' format and all short form occurrences with the
+        standard 'C. {species}' format. The first full occurrence of each species
+        is linked (unless it is a pseudospecies or in exclude), the rest are
+        italicized
+
+        >>> SpeciesLinker().scan('Ananas. Amaranthus dubius')
+        'Ananas. <taxon genus="Amaranthus" species="dubius" sub-prefix="" sub-species=""><sp>Amaranthus</sp> <sp>dubius</sp></taxon>'
+
+        :param text: the text to scan
+        :param exclude: names that are never linked
+        :returns: text with species links inserted
+        '''
+        # Only species whose name occurs in the text can match. Their patterns
+        # go into one alternation, so the text is scanned once
+        lowered = text.lower()
+        candidates = [rec for rec in self.species if rec.needle in lowered]
+        if not candidates:
+            return text
+
+        scanner = compile_scanner(tuple(rec.forms for rec in candidates))
+        return scanner.sub(species_replacer(candidates, exclude), text)
+
+    def insert(self, root):
+        '''
+        (Element) -> None
+        Inserts species links into article (titles + abstracts) where possible
+        '''
+        for title in root.iter('title'):
+            self.process_text(title)
+
+        for abstract in root.iter('abstract'):
+            self.process_text(abstract, is_abstract=True)
+
+    def process_text(self, elem, is_abstract=False):
+        '''
+        (Element, bool) -> None
+        Inserts species links into the text of a title or abstract. In abstracts,
+        names that are genuses are never linked, and lone genuses are linked and
+        italicized as well (see link_genuses)
+
+        :param elem: the title or abstract
+        :param is_abstract: whether elem is an abstract
+        '''
+        # Empty titles and abstracts have nothing to link
+        if not elem.text:
+            return
+
+        if is_abstract:
+            elem.text = self.link_genuses(self.scan(elem.text, self.genus_to_species))
+        else:
+            elem.text = self.scan(elem.text)
+
+    def link_genuses(self, text):
+        '''
+        (str) -> str
+        For each linked species, if its genus occurs on its own before any links
+        of the same genus (but different species), adds a species link for it.
+        Subsequent occurrences of just the genus are italicized
+
+        :param text: abstract text with species links inserted
+        :returns: text with genus links inserted
+        '''
+        for genus in self.genus_to_species:
+            # Find the first link for a given genus
+            first_link = self.link_patterns[genus].search(text)
+
+            if first_link is not None:
                 # Find first occurrence of genus (on its own)
-                first_genus = re.search(re.escape(genus), abstract.text[:matches[0][0]], re.IGNORECASE)
+                first_genus = self.genus_names[genus].search(text, 0, first_link.start())
                 if first_genus is not None:
                     first_genus = first_genus.span()
 
                     # If first occurrence of genus precedes first species link for it, add another link
-                    if (first_genus[1] < matches[0][0]):
-                        abstract.text = abstract.text[:first_genus[0]] + get_species_link(abstract.text[first_genus[0]:first_genus[1]]) + abstract.text[first_genus[1]:]
-            
-            # Italicize subsequent occurrences of just the genus
-            matches = []
-            for match in re.finditer(r' ' + re.escape(genus.replace('*', '')) + r'[ \n\.,\?\!]', abstract.text, re.IGNORECASE):
-                matches.append(match.span())
-            
-            for i in range(len(matches) -1, -1, -1):
-                abstract.text = abstract.text[:matches[i][0]] + ' <i>' + abstract.text[matches[i][0]+1:matches[i][1]-1] + "</i>" + abstract.text[matches[i][1]-1] + abstract.text[matches[i][1]:]
-   
+                    if (first_genus[1] < first_link.start()):
+                        text = text[:first_genus[0]] + get_species_link(text[first_genus[0]:first_genus[1]]) + text[first_genus[1]:]
+
+        # Italicize subsequent occurrences of just the genus
+        return self.genus_scanner.sub(r'<i>\1</i>', text)
+
+
+@lru_cache(maxsize=1024)
+def compile_scanner(forms):
+    """
+    (tuple) -> Pattern
+    Compiles an alternation of the species patterns in forms, each in a group
+    of its own (see species_replacer). Cached, since the same candidate
+    species come up across the titles and abstracts of an issue
+
+    :param forms: the forms patterns of the candidate species, in list order
+    :returns: the compiled alternation
+    """
+    return re.compile('|'.join(f'({f})' for f in forms), re.IGNORECASE)
+
+def species_replacer(candidates, exclude=()):
+    """
+    (list, container) -> function
+    Returns a re.sub callback for an alternation of the forms patterns of
+    candidates, each in a group of its own: group 2i+1 matches either form
+    of candidates[i], and group 2i+2 is set for its full form. The first
+    full occurrence of each species becomes a species link (unless it is a
+    pseudospecies or in exclude), every other occurrence is italicized
+
+    :param candidates: the species records in the alternation
+    :param exclude: names that are never linked
+    :returns: replacement function for re.sub
+    """
+    linked = set()
+
+    def replace(match):
+        i = (match.lastindex - 1) // 2
+        spec = remove_blank_chars(match.group(0))
+        if match.group(match.lastindex + 1) is not None and i not in linked:
+            linked.add(i)
+            if not candidates[i].pseudo and spec not in exclude:
+                return get_species_link(spec)
+        return f'<i>{spec}</i>'
+
+    return replace
 
 def is_species_link(text):
     """
@@ -218,7 +241,7 @@ def is_species_link(text):
     :returns: True if text is a species link
     """
 
-    return re.match(r'^<taxon genus=".*" species=".*" sub-prefix=".*" sub-species=".*">.*<\/taxon>$', text)
+    return _SPECIES_LINK.match(text)
 
 def remove_blank_chars(text):
     """
@@ -232,10 +255,7 @@ def remove_blank_chars(text):
     :param text: text from which to remove superfluous blanks
     :returns: text with superfluous blanks removed
     """
-    text = text.replace('\n', ' ')
-    while '  ' in text:
-        text = text.replace('  ', ' ')
-    return text
+    return _BLANKS.sub(' ', text)
 
 
 def remove_species_link(text):
@@ -250,59 +270,32 @@ def remove_species_link(text):
     :returns: text with species links removed
     """
 
-    text = re.sub(r'''<taxon genus=".*" species=".*" sub-prefix=
-        ".*" sub-species=".*">''', '', text)
-    text = re.sub(r'<\/?sp>', '', text)
+    text = _TAXON_OPEN_TAG.sub('', text)
+    text = _SP_TAG.sub('', text)
     text = text.replace("</taxon>", "")
     return text
 
+@lru_cache(maxsize=4096)
 def get_species_link(link):
     """
     (str) -> str
     Given text link containing (ideally) just a species name, returns a species
     link for said species (if possible). If not possible, simply returns link
-    unaltered.
+    unaltered. Results are cached, since the same names recur throughout an
+    article.
 
     :param link: the text to convert to a species link
     :returns: link converted to a species link
     """
 
     tokens = link.split()
+    if not tokens:
+        return link
 
-    # Single genus name
-    if len(tokens) == 1:
-        link = genus_spp(tokens)
-
-    # Genus and subspecies
-    elif len(tokens) == 2:
-        if (tokens[1] == "sp." or tokens[1] == "spp."):
-            link = genus_spp(tokens)
-        else:
-            # Note, judgement is required in cases of abbreviated species
-            # names. They get caught here
-            link = genus_species(tokens)
-
-    # Genus species subspecies, or links including "sp." and it's derivatives
-    elif len(tokens) == 3:
-        if (tokens[1] not in {"sp.", "spp."}):
-            if (is_enclosed_match(tokens[0], tokens[1])):
-                link = genus_PARgenusPAR_subspecies(tokens)
-
-            elif (is_parenthetical(tokens[1])):
-                link = genus_PARnamePAR_species(tokens)
-
-            else:
-                link = genus_species_subspecies(tokens)
-
-    # Standard genus, species, subprefix, and subspecies all in one link
-    elif len(tokens) == 4:
-        link = genus_species_subprefix_subspecies(tokens)
-
-    # Species name with multiple subprefixes
-    elif len(tokens) > 4:
-        link = genus_species_MERGE_subspecies(tokens)
-
-    return link
+    # Pick the link format by the number of tokens (see _LINK_BUILDERS). Species
+    # names with multiple subprefixes (more than 4 tokens) are merged
+    build = _LINK_BUILDERS.get(len(tokens), genus_species_MERGE_subspecies)
+    return build(tokens) or link
 
 def is_enclosed_match(s1, s2):
     """
@@ -364,7 +357,8 @@ def genus_species_subspecies(tokens):
             sub-species="capitata"><sp>Brassica</sp> <sp>oleracea</sp>
             <sp>capitata</sp></taxon>
     """
-    return genus_species_subprefix_subspecies([tokens[0], tokens[1], "", tokens[2]]).replace("  ", " ")
+    (genus, species, subspecies) = tokens[0:3]
+    return f'''<taxon genus="{genus}" species="{species}" sub-prefix="" sub-species="{subspecies}"><sp>{genus}</sp> <sp>{species}</sp> <sp>{subspecies}</sp></taxon>'''
 
 
 def genus_species_subprefix_subspecies(tokens):
@@ -414,3 +408,44 @@ def genus_species_MERGE_subspecies(tokens):
     merge = ' '.join(tokens[2:-1])
     subspecies = tokens[-1]
     return f'''<taxon genus="{genus}" species="{species}" sub-prefix="" sub-species="{subspecies}"><sp>{genus}</sp> <sp>{species}</sp> {merge} <sp>{subspecies}</sp></taxon>'''
+
+
+def two_part_link(tokens):
+    """
+    (list) -> str
+    Genus and species, or a genus followed by "sp."/"spp."
+    """
+    if (tokens[1] == "sp." or tokens[1] == "spp."):
+        return genus_spp(tokens)
+
+    # Note, judgement is required in cases of abbreviated species
+    # names. They get caught here
+    return genus_species(tokens)
+
+
+def three_part_link(tokens):
+    """
+    (list) -> str
+    Genus species subspecies, or links including "sp." and it's derivatives
+    (which are left alone, signalled by returning None)
+    """
+    if (tokens[1] in {"sp.", "spp."}):
+        return None
+
+    if (is_enclosed_match(tokens[0], tokens[1])):
+        return genus_PARgenusPAR_subspecies(tokens)
+
+    if (is_parenthetical(tokens[1])):
+        return genus_PARnamePAR_species(tokens)
+
+    return genus_species_subspecies(tokens)
+
+
+# Link format for each number of tokens in a species name
+_LINK_BUILDERS = {
+    1: genus_spp,
+    2: two_part_link,
+    3: three_part_link,
+    # Standard genus, species, subprefix, and subspecies all in one link
+    4: genus_species_subprefix_subspecies,
+}